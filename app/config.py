@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import os
 from functools import lru_cache
 from typing import Optional, List
@@ -43,6 +43,7 @@ class Config:
 
     # Database
     DATABASE_URL: Optional[str]
+    SQL_ECHO: bool
 
     # Payment gateways (keep secrets only in env / secret manager)
     STRIPE_API_KEY: Optional[str]
@@ -51,6 +52,10 @@ class Config:
     PAYPAL_CLIENT_ID: Optional[str]
     PAYPAL_CLIENT_SECRET: Optional[str]
 
+    RAZORPAY_KEY_ID: Optional[str]
+    RAZORPAY_KEY_SECRET: Optional[str]
+    RAZORPAY_WEBHOOK_SECRET: Optional[str]
+
     # Defaults and behavior
     DEFAULT_CURRENCY: str
     PAYMENT_TIMEOUT_SECONDS: int
@@ -60,15 +65,19 @@ class Config:
     # Logging
     LOG_LEVEL: str
 
+    # Derived once in __post_init__ (the instance is frozen, so it cannot go stale)
+    _any_provider: bool = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(
+            self,
+            "_any_provider",
+            bool(self.STRIPE_API_KEY) or bool(self.PAYPAL_CLIENT_ID and self.PAYPAL_CLIENT_SECRET),
+        )
+
     @property
     def any_payment_provider_configured(self) -> bool:
-        return any(
-            bool(x)
-            for x in (
-                self.STRIPE_API_KEY,
-                self.PAYPAL_CLIENT_ID and self.PAYPAL_CLIENT_SECRET,
-            )
-        )
+        return self._any_provider
 
     def validate_required(self) -> None:
         """
@@ -99,10 +108,14 @@ def get_config() -> Config:
         DEBUG=debug,
         SECRET_KEY=os.getenv("SECRET_KEY", ""),  # required, validate later
         DATABASE_URL=os.getenv("DATABASE_URL"),
+        SQL_ECHO=_parse_bool(os.getenv("SQL_ECHO")),
         STRIPE_API_KEY=os.getenv("STRIPE_API_KEY"),
         STRIPE_WEBHOOK_SECRET=os.getenv("STRIPE_WEBHOOK_SECRET"),
         PAYPAL_CLIENT_ID=os.getenv("PAYPAL_CLIENT_ID"),
         PAYPAL_CLIENT_SECRET=os.getenv("PAYPAL_CLIENT_SECRET"),
+        RAZORPAY_KEY_ID=os.getenv("RAZORPAY_KEY_ID"),
+        RAZORPAY_KEY_SECRET=os.getenv("RAZORPAY_KEY_SECRET"),
+        RAZORPAY_WEBHOOK_SECRET=os.getenv("RAZORPAY_WEBHOOK_SECRET"),
         DEFAULT_CURRENCY=os.getenv("DEFAULT_CURRENCY", "USD"),
         PAYMENT_TIMEOUT_SECONDS=_parse_int(os.getenv("PAYMENT_TIMEOUT_SECONDS"), 30),
         PAYMENT_MAX_RETRIES=_parse_int(os.getenv("PAYMENT_MAX_RETRIES"), 3),
@@ -1,26 +1,56 @@
-import os
 from typing import Iterator, Optional
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
+from sqlalchemy.pool import StaticPool
+from .config import get_config
 
 """
 /home/jatin/FastPay/app/database.py
 
 Lightweight SQLAlchemy setup for the FastPay app.
 
-- Reads DATABASE_URL from env (defaults to sqlite:///./fastpay.db)
+- Reads DATABASE_URL from the cached config (defaults to sqlite:///./fastpay.db)
+- Applies WAL and related PRAGMAs to sqlite connections
 - Exposes: engine, SessionLocal, Base, get_db (dependency / context manager), init_db()
 """
 
 
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./fastpay.db")
-SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
+cfg = get_config()
+DATABASE_URL = cfg.DATABASE_URL or "sqlite:///./fastpay.db"
+SQL_ECHO = cfg.SQL_ECHO
+
+_IS_SQLITE = DATABASE_URL.startswith("sqlite")
 
 # sqlite requires special connect args
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+connect_args = {"check_same_thread": False} if _IS_SQLITE else {}
+
+engine_kwargs = {}
+# an in-memory sqlite database only exists inside its one connection, so share it
+if _IS_SQLITE and make_url(DATABASE_URL).database in (None, "", ":memory:"):
+    engine_kwargs["poolclass"] = StaticPool
+
+engine = create_engine(DATABASE_URL, connect_args=connect_args, echo=SQL_ECHO, pool_pre_ping=True, **engine_kwargs)
+
+if _IS_SQLITE:
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_con, _connection_record) -> None:
+        """
+        Tune every new sqlite connection:
+        - WAL lets readers proceed while a writer is active
+        - synchronous=NORMAL is durable enough under WAL and avoids an fsync per commit
+        - temp tables/indices in memory, and mmap'd reads of the database file
+        """
+        cur = dbapi_con.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.execute("PRAGMA mmap_size=268435456")
+        cur.close()
+
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args, echo=SQL_ECHO, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -49,9 +79,13 @@ def get_db() -> Iterator[Session]:
 
 def init_db(drop_all: bool = False) -> None:
     """
-    Create all tables defined on Base metadata.
+    Create all tables defined on Base metadata, plus any of their indexes missing
+    from tables that already existed (create_all skips existing tables entirely).
     Call with drop_all=True to drop existing tables first (use with caution).
     """
     if drop_all:
         Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
\ No newline at end of file
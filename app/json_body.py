@@ -0,0 +1,54 @@
+from typing import Any, Union
+import json
+import math
+import re
+import orjson
+
+"""
+app/json_body.py
+
+JSON parsing for request bodies that were already read (webhook routers).
+"""
+
+
+# orjson turns integers outside the int64/uint64 range into floats without raising; any
+# run of 19+ digits may be one of those, so such bodies go through the stdlib parser.
+# The scan is over raw bytes and also matches digits inside strings, so bodies carrying
+# long numeric ids or nanosecond timestamps always take the (slower) stdlib path.
+_WIDE_INT = re.compile(rb"\d{19}")
+
+# \uD800-\uDFFF escapes; only bodies containing one can decode to an unpaired surrogate
+_SURROGATE_ESCAPE = re.compile(rb"\\u[dD][89a-fA-F]")
+
+
+def _reject_constant(name: str) -> Any:
+    # orjson rejects NaN/Infinity
+    raise ValueError(f"invalid JSON constant {name}")
+
+
+def _parse_finite_float(value: str) -> float:
+    # orjson rejects numbers that overflow a double (e.g. 1e400) instead of returning inf
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"number is infinity when parsed as double: {value}")
+    return number
+
+
+def loads_exact(raw_body: Union[bytes, bytearray]) -> Any:
+    """
+    Parse raw_body with orjson, falling back to json.loads when it may hold an integer
+    orjson cannot represent exactly. The fallback accepts the same documents orjson does:
+    strict UTF-8, no NaN/Infinity, no non-finite floats and no unpaired surrogates.
+    Raises ValueError on malformed input.
+    """
+    if not _WIDE_INT.search(raw_body):
+        return orjson.loads(raw_body)
+    # decode here: json.loads would pass encoded surrogates and sniff UTF-16/32
+    text = bytes(raw_body).decode("utf-8")
+    value = json.loads(text, parse_float=_parse_finite_float, parse_constant=_reject_constant)
+    if _SURROGATE_ESCAPE.search(raw_body):
+        try:
+            json.dumps(value, ensure_ascii=False).encode("utf-8")
+        except UnicodeEncodeError:
+            raise ValueError("unpaired surrogate in string") from None
+    return value
@@ -1,13 +1,16 @@
-from datetime import datetime
-from typing import List, Optional
-from .enums import PaymentStatus
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from decimal import Decimal
+import time
+from typing import Annotated, List, Optional
 from uuid import uuid4
 from fastapi import Depends, FastAPI, HTTPException, Query, status
-from pydantic import BaseModel, Field, constr, root_validator, validator
-from sqlalchemy import Column, DateTime, Enum, Integer, String, create_engine, select
-from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints, condecimal, field_validator
+from sqlalchemy import Column, DateTime, Enum, Index, Integer, String, delete, func, insert, select, update
+from sqlalchemy.orm import Session
 import uvicorn
+from .database import Base, get_db, init_db
 
 #!/usr/bin/env python3
 """
@@ -20,13 +23,8 @@ Usage:
 
 
 
-# ---------- Database setup ----------
-SQLITE_URL = "sqlite:///./fastpay.db"
-engine = create_engine(SQLITE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
-Base = declarative_base()
-
-
+# ---------- Database models ----------
+# Engine, sessions and Base are shared with app.database
 class PaymentStatus(str):
     PENDING = "pending"
     COMPLETED = "completed"
@@ -34,132 +32,163 @@ class PaymentStatus(str):
     REFUNDED = "refunded"
 
 
+# Simple state transition guard: don't allow going from refunded to completed, etc.
+_ALLOWED_TRANSITIONS = {
+    PaymentStatus.PENDING: frozenset((PaymentStatus.COMPLETED, PaymentStatus.FAILED, PaymentStatus.REFUNDED)),
+    PaymentStatus.COMPLETED: frozenset((PaymentStatus.REFUNDED,)),
+    PaymentStatus.FAILED: frozenset(),
+    PaymentStatus.REFUNDED: frozenset(),
+}
+
+# Inverse of _ALLOWED_TRANSITIONS: statuses a payment may be in to reach a given status
+# (including the status itself, since a noop is allowed)
+_ALLOWED_PREV = {
+    target: tuple(sorted({target} | {cur for cur, nxt in _ALLOWED_TRANSITIONS.items() if target in nxt}))
+    for target in _ALLOWED_TRANSITIONS
+}
+
+
 class PaymentORM(Base):
     __tablename__ = "payments"
 
-    id = Column(String(36), primary_key=True, index=True)
+    id = Column(String(32), primary_key=True)  # uuid4 hex, no dashes
     amount_cents = Column(Integer, nullable=False)  # amount stored as integer cents
     currency = Column(String(3), nullable=False, index=True)
     method = Column(String(50), nullable=False)
     status = Column(String(20), nullable=False, default=PaymentStatus.PENDING)
     description = Column(String(255), nullable=True)
-    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # stamped by the database, so inserts don't call into Python for the time. default renders
+    # now() into each ORM INSERT, so tables created before server_default existed still get a value
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, default=func.now(), server_default=func.now(), index=True
+    )
 
 
-Base.metadata.create_all(bind=engine)
+# Backs list_payments (WHERE status = ? ORDER BY created_at DESC, id DESC) from a single index
+Index("ix_payments_status_created_desc", PaymentORM.status, PaymentORM.created_at.desc(), PaymentORM.id.desc())
 
 
 # ---------- Pydantic schemas ----------
 class PaymentCreate(BaseModel):
-    amount: float = Field(..., gt=0, description="Amount in major currency units (e.g. 12.34)")
-    currency: constr(min_length=3, max_length=3) = Field(..., description="ISO 4217 currency code, e.g. USD")
+    amount: condecimal(gt=Decimal("0"), max_digits=12, decimal_places=2) = Field(
+        ..., description="Amount in major currency units (e.g. 12.34)"
+    )
+    currency: Annotated[str, StringConstraints(min_length=3, max_length=3, to_upper=True)] = Field(
+        ..., description="ISO 4217 currency code, e.g. USD"
+    )
     method: str = Field(..., min_length=1, max_length=50)
     description: Optional[str] = Field(None, max_length=255)
 
-    @validator("currency")
-    def upper_currency(cls, v):
-        return v.upper()
-
-    @root_validator
-    def check_amount_precision(cls, values):
-        # Ensure at most 2 decimal places
-        amount = values.get("amount")
-        if amount is not None:
-            cents = round(amount * 100)
-            if abs(amount * 100 - cents) > 1e-6:
-                raise ValueError("amount must have at most 2 decimal places")
-        return values
-
 
 class PaymentUpdate(BaseModel):
     description: Optional[str] = Field(None, max_length=255)
     status: Optional[str] = Field(None)
 
-    @validator("status")
+    @field_validator("status")
+    @classmethod
     def validate_status(cls, v):
         if v is None:
             return v
         v = v.lower()
-        allowed = {PaymentStatus.PENDING, PaymentStatus.COMPLETED, PaymentStatus.FAILED, PaymentStatus.REFUNDED}
-        if v not in allowed:
-            raise ValueError(f"status must be one of {sorted(list(allowed))}")
+        if v not in _ALLOWED_TRANSITIONS:
+            raise ValueError(f"status must be one of {sorted(_ALLOWED_TRANSITIONS)}")
         return v
 
 
 class PaymentRead(BaseModel):
-    id: str
-    amount: float
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str = Field(..., description="32-character hex UUID")
+    amount: float = Field(..., description="Amount in major currency units (e.g. 12.34)")
     currency: str
     method: str
     status: str
-    description: Optional[str]
+    description: Optional[str] = None
     created_at: datetime
 
-    class Config:
-        orm_mode = True
 
-
-# ---------- Dependency ----------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Columns backing PaymentRead, selected directly so rows come back as plain tuples
+_PAYMENT_COLUMNS = (
+    PaymentORM.id,
+    PaymentORM.amount_cents,
+    PaymentORM.currency,
+    PaymentORM.method,
+    PaymentORM.status,
+    PaymentORM.description,
+    PaymentORM.created_at,
+)
+
+
+def _payment_read(id, amount_cents, currency, method, status, description, created_at) -> PaymentRead:
+    # Values come from our own DB, so skip re-validating them
+    return PaymentRead.model_construct(
+        id=id,
+        amount=amount_cents / 100,
+        currency=currency,
+        method=method,
+        status=status,
+        description=description,
+        created_at=created_at,
+    )
 
 
 # ---------- App and routes ----------
-app = FastAPI(title="FastPay API", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create tables once per process on startup rather than at import time
+    init_db()
+    yield
+
+
+app = FastAPI(title="FastPay API", version="0.1.0", default_response_class=ORJSONResponse, lifespan=lifespan)
+
+
+# (unix second, ISO-8601 string) served by the health check, rebuilt at most once a second
+_health_time = (0, "")
+
+
+def _utc_now_iso() -> str:
+    global _health_time
+    now = int(time.time())
+    if now != _health_time[0]:
+        _health_time = (now, datetime.fromtimestamp(now, timezone.utc).isoformat())
+    return _health_time[1]
 
 
 @app.get("/", summary="Service health")
 def root():
-    return {"service": "FastPay", "status": "ok", "time": datetime.utcnow().isoformat()}
+    return {"service": "FastPay", "status": "ok", "time": _utc_now_iso()}
 
 
 @app.post("/payments", response_model=PaymentRead, status_code=status.HTTP_201_CREATED)
 def create_payment(payload: PaymentCreate, db: Session = Depends(get_db)):
-    payment_id = str(uuid4())
-    amount_cents = int(round(payload.amount * 100))
-    orm = PaymentORM(
-        id=payment_id,
-        amount_cents=amount_cents,
-        currency=payload.currency,
-        method=payload.method,
-        description=payload.description,
-        status=PaymentStatus.PENDING,
-        created_at=datetime.utcnow(),
+    # amount has at most 2 decimal places, so this is exact
+    amount_cents = int(payload.amount * 100)
+    # One INSERT ... RETURNING instead of an ORM add/flush/refresh cycle
+    stmt = (
+        insert(PaymentORM)
+        .values(
+            id=uuid4().hex,
+            amount_cents=amount_cents,
+            currency=payload.currency,
+            method=payload.method,
+            description=payload.description,
+            status=PaymentStatus.PENDING,
+        )
+        .returning(*_PAYMENT_COLUMNS)
     )
-    db.add(orm)
+    row = db.execute(stmt).one()
     db.commit()
-    db.refresh(orm)
-    return PaymentRead(
-        id=orm.id,
-        amount=orm.amount_cents / 100.0,
-        currency=orm.currency,
-        method=orm.method,
-        status=orm.status,
-        description=orm.description,
-        created_at=orm.created_at,
-    )
+    return _payment_read(*row)
 
 
 @app.get("/payments/{payment_id}", response_model=PaymentRead)
 def get_payment(payment_id: str, db: Session = Depends(get_db)):
-    stmt = select(PaymentORM).where(PaymentORM.id == payment_id)
-    try:
-        result = db.execute(stmt).scalar_one()
-    except NoResultFound:
+    stmt = select(*_PAYMENT_COLUMNS).where(PaymentORM.id == payment_id)
+    row = db.execute(stmt).one_or_none()
+    if row is None:
         raise HTTPException(status_code=404, detail="payment not found")
-    return PaymentRead(
-        id=result.id,
-        amount=result.amount_cents / 100.0,
-        currency=result.currency,
-        method=result.method,
-        status=result.status,
-        description=result.description,
-        created_at=result.created_at,
-    )
+    return _payment_read(*row)
 
 
 @app.get("/payments", response_model=List[PaymentRead])
@@ -169,76 +198,62 @@ def list_payments(
     offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
 ):
-    stmt = select(PaymentORM)
+    stmt = select(*_PAYMENT_COLUMNS)
     if status:
         stmt = stmt.where(PaymentORM.status == status.lower())
-    stmt = stmt.order_by(PaymentORM.created_at.desc()).limit(limit).offset(offset)
-    rows = db.execute(stmt).scalars().all()
+    # sqlite's now() has one-second resolution, so id breaks ties and keeps pages stable
+    stmt = stmt.order_by(PaymentORM.created_at.desc(), PaymentORM.id.desc()).limit(limit).offset(offset)
+    construct = PaymentRead.model_construct
     return [
-        PaymentRead(
-            id=r.id,
-            amount=r.amount_cents / 100.0,
-            currency=r.currency,
-            method=r.method,
-            status=r.status,
-            description=r.description,
-            created_at=r.created_at,
+        construct(
+            id=i,
+            amount=c / 100,
+            currency=cur,
+            method=m,
+            status=s,
+            description=d,
+            created_at=ca,
         )
-        for r in rows
+        for (i, c, cur, m, s, d, ca) in db.execute(stmt).all()
     ]
 
 
 @app.put("/payments/{payment_id}", response_model=PaymentRead)
 def update_payment(payment_id: str, payload: PaymentUpdate, db: Session = Depends(get_db)):
-    stmt = select(PaymentORM).where(PaymentORM.id == payment_id)
-    try:
-        result = db.execute(stmt).scalar_one()
-    except NoResultFound:
-        raise HTTPException(status_code=404, detail="payment not found")
-
+    values = {}
+    stmt = update(PaymentORM).where(PaymentORM.id == payment_id)
     if payload.description is not None:
-        result.description = payload.description
+        values["description"] = payload.description
     if payload.status is not None:
-        # Simple state transition guard: don't allow going from refunded to completed, etc.
-        allowed_transitions = {
-            PaymentStatus.PENDING: {PaymentStatus.COMPLETED, PaymentStatus.FAILED, PaymentStatus.REFUNDED},
-            PaymentStatus.COMPLETED: {PaymentStatus.REFUNDED},
-            PaymentStatus.FAILED: set(),
-            PaymentStatus.REFUNDED: set(),
-        }
-        current = result.status
-        if payload.status not in allowed_transitions.get(current, set()):
-            # allow noop
-            if payload.status != current:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"invalid status transition from {current} to {payload.status}",
-                )
-        result.status = payload.status
-
-    db.add(result)
+        # Only match rows whose current status may move to the requested one,
+        # so the transition check and the write are one statement
+        stmt = stmt.where(PaymentORM.status.in_(_ALLOWED_PREV[payload.status]))
+        values["status"] = payload.status
+    if not values:
+        return get_payment(payment_id, db)
+
+    stmt = stmt.values(**values).returning(*_PAYMENT_COLUMNS)
+    row = db.execute(stmt, execution_options={"synchronize_session": False}).one_or_none()
+    if row is None:
+        # Nothing matched: tell a missing payment apart from a rejected transition
+        current = db.execute(select(PaymentORM.status).where(PaymentORM.id == payment_id)).scalar_one_or_none()
+        if current is None:
+            raise HTTPException(status_code=404, detail="payment not found")
+        raise HTTPException(
+            status_code=400,
+            detail=f"invalid status transition from {current} to {payload.status}",
+        )
     db.commit()
-    db.refresh(result)
-    return PaymentRead(
-        id=result.id,
-        amount=result.amount_cents / 100.0,
-        currency=result.currency,
-        method=result.method,
-        status=result.status,
-        description=result.description,
-        created_at=result.created_at,
-    )
+    return _payment_read(*row)
 
 
 @app.delete("/payments/{payment_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_payment(payment_id: str, db: Session = Depends(get_db)):
-    stmt = select(PaymentORM).where(PaymentORM.id == payment_id)
-    try:
-        result = db.execute(stmt).scalar_one()
-    except NoResultFound:
-        raise HTTPException(status_code=404, detail="payment not found")
-    db.delete(result)
+    stmt = delete(PaymentORM).where(PaymentORM.id == payment_id)
+    result = db.execute(stmt, execution_options={"synchronize_session": False})
     db.commit()
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="payment not found")
     return None
 
 
@@ -4,7 +4,8 @@ from django.conf import settings
 from django.core.validators import MinValueValidator
 from django.db import models
 from django.db import transaction
-from django.db.models import F
+from django.db.models import F, Sum
+from django.utils import timezone
 
 """
 /home/jatin/FastPay/app/models.py
@@ -27,6 +28,13 @@ CURRENCY_CHOICES = [
 ]
 
 
+def new_payment_reference() -> str:
+    """
+    Default PaymentTransaction.reference, so every stored transaction has one.
+    """
+    return f"pay_{uuid.uuid4().hex}"
+
+
 class Account(models.Model):
     """
     A wallet/account tied to a user. Use atomic operations to update balance.
@@ -75,15 +83,21 @@ class Account(models.Model):
         if amount < 0:
             raise ValueError("debit amount must be non-negative")
         with transaction.atomic():
-            # Use select_for_update to ensure consistent check/update in concurrent scenarios
-            a = Account.objects.select_for_update().get(pk=self.pk)
-            if a.balance < amount:
+            # Use select_for_update to ensure consistent check/update in concurrent scenarios.
+            # Only the balance column is fetched, so metadata is never deserialized.
+            balance = (
+                Account.objects.select_for_update(of=("self",))
+                .filter(pk=self.pk)
+                .values_list("balance", flat=True)
+                .first()
+            )
+            if balance is None:
+                raise Account.DoesNotExist
+            if balance < amount:
                 raise ValueError("insufficient funds")
-            a.balance = F("balance") - amount
-            a.save(update_fields=["balance"])
-            a.refresh_from_db(fields=["balance"])
-            # sync self to updated instance
-            self.balance = a.balance
+            Account.objects.filter(pk=self.pk).update(balance=F("balance") - amount)
+            # the row is locked, so the new balance is known without re-reading it
+            self.balance = balance - amount
             return self.balance
 
 
@@ -133,7 +147,7 @@ class PaymentTransaction(models.Model):
     amount = models.DecimalField(max_digits=18, decimal_places=2, validators=[MinValueValidator(Decimal("0.01"))])
     currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default="USD")
     status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
-    reference = models.CharField(max_length=255, blank=True, db_index=True)
+    reference = models.CharField(max_length=255, blank=True, db_index=True, default=new_payment_reference)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
@@ -141,7 +155,7 @@ class PaymentTransaction(models.Model):
 
     class Meta:
         indexes = [
-            models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["status", "-created_at"]),
             models.Index(fields=["reference"]),
         ]
         ordering = ["-created_at"]
@@ -190,34 +204,32 @@ class Refund(models.Model):
             raise ValueError("can only refund completed transactions")
 
         with transaction.atomic():
-            src = tx.to_account  # where funds were sent originally
-            dst = tx.from_account
-            if dst is None:
+            src_pk = tx.to_account_id  # where funds were sent originally
+            dst_pk = tx.from_account_id
+            if dst_pk is None:
                 raise ValueError("original payer account not available for refund")
 
             # debit from merchant/receiver (src) and credit back to payer (dst)
-            if src is None:
+            if src_pk is None:
                 raise ValueError("source account for refund not available")
-            # ensure source has funds
-            src = Account.objects.select_for_update().get(pk=src.pk)
-            if src.balance < self.amount:
+            # conditional debit: no row is updated if the source lacks funds
+            updated = Account.objects.filter(pk=src_pk, balance__gte=self.amount).update(
+                balance=F("balance") - self.amount
+            )
+            if not updated:
                 raise ValueError("insufficient funds in source account to process refund")
+            Account.objects.filter(pk=dst_pk).update(balance=F("balance") + self.amount)
 
-            # perform updates
-            src.balance = F("balance") - self.amount
-            src.save(update_fields=["balance"])
-
-            dst.balance = F("balance") + self.amount
-            dst.save(update_fields=["balance"])
-
-            # mark refund processed
-            self.processed_at = models.functions.Now()
-            self.save(update_fields=["processed_at"])
+            # mark refund processed, keeping the returned instance in step with the row
+            now = timezone.now()
+            Refund.objects.filter(pk=self.pk).update(processed_at=now)
+            self.processed_at = now
 
             # update transaction status if fully refunded
-            total_refunded = sum([r.amount for r in tx.refunds.all()])
+            # sum in the database rather than loading every refund row
+            total_refunded = tx.refunds.aggregate(total=Sum("amount"))["total"] or Decimal("0")
             if total_refunded >= tx.amount:
+                PaymentTransaction.objects.filter(pk=tx.pk).update(status=tx.STATUS_REFUNDED)
                 tx.status = tx.STATUS_REFUNDED
-                tx.save(update_fields=["status"])
 
             return self
\ No newline at end of file
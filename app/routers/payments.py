@@ -1,11 +1,13 @@
 from typing import Optional
-import os
 import hmac
-import hashlib
 from decimal import Decimal
 import logging
 from fastapi import APIRouter, Request, HTTPException, status
-from pydantic import BaseModel, Field, validator
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field, field_validator
+from ..config import get_config
+from ..json_body import loads_exact
+from ..signatures import decode_hex_signature, keyed_hmac
 
 # /home/jatin/FastPay/app/routers/payments.py
 # Razorpay integration router for FastAPI
@@ -19,17 +21,23 @@ except Exception as e:
 
 logger = logging.getLogger("payments")
 
-# Load credentials from environment (do NOT hardcode keys)
-RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID", "")
-RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET", "")
-RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET", "")
+# Load credentials from the cached config (do NOT hardcode keys)
+cfg = get_config()
+RAZORPAY_KEY_ID = cfg.RAZORPAY_KEY_ID or ""
+RAZORPAY_KEY_SECRET = cfg.RAZORPAY_KEY_SECRET or ""
+RAZORPAY_WEBHOOK_SECRET = cfg.RAZORPAY_WEBHOOK_SECRET or ""
 
 if not (RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET):
     logger.warning("Razorpay credentials are not set in environment variables.")
 
+# Pre-keyed HMAC objects: the ipad/opad key setup runs once here and each
+# verification works on a cheap copy()
+_KEY_HMAC = keyed_hmac(RAZORPAY_KEY_SECRET) if RAZORPAY_KEY_SECRET else None
+_WEBHOOK_HMAC = keyed_hmac(RAZORPAY_WEBHOOK_SECRET) if RAZORPAY_WEBHOOK_SECRET else None
+
 client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
 
-router = APIRouter(prefix="/payments", tags=["payments"])
+router = APIRouter(prefix="/payments", tags=["payments"], default_response_class=ORJSONResponse)
 
 
 def _to_paise(amount: Decimal) -> int:
@@ -40,15 +48,22 @@ def _to_paise(amount: Decimal) -> int:
     return int((amount * Decimal("100")).quantize(Decimal("1")))
 
 
-def _verify_signature(received_signature: str, payload: bytes, secret: str) -> bool:
+def _verify_signature(received_signature: str, payload: bytes, template: Optional[hmac.HMAC]) -> bool:
     """
     Generic HMAC SHA256 verification returning boolean.
-    ``payload`` must be the raw bytes used for signature generation.
+    ``payload`` must be the raw bytes used for signature generation and
+    ``template`` a pre-keyed HMAC object (from keyed_hmac), which is copied rather than mutated.
+    The raw digest is compared against the decoded hex signature, so no hex
+    string is built per request.
     """
-    if not secret:
+    if template is None:
+        return False
+    received = decode_hex_signature(received_signature)
+    if received is None:
         return False
-    computed = hmac.new(secret.encode("utf-8"), payload, hashlib.sha256).hexdigest()
-    return hmac.compare_digest(computed, received_signature)
+    mac = template.copy()
+    mac.update(payload)
+    return hmac.compare_digest(mac.digest(), received)
 
 
 class CreateOrderRequest(BaseModel):
@@ -57,7 +72,8 @@ class CreateOrderRequest(BaseModel):
     receipt: Optional[str] = None
     payment_capture: int = Field(1, ge=0, le=1, description="1 for automatic capture, 0 for manual")
 
-    @validator("amount")
+    @field_validator("amount")
+    @classmethod
     def positive_amount(cls, v: Decimal):
         if v <= 0:
             raise ValueError("amount must be positive")
@@ -126,8 +142,7 @@ def verify_payment(payload: VerifyPaymentRequest):
 
     message = f"{payload.razorpay_order_id}|{payload.razorpay_payment_id}".encode("utf-8")
     try:
-        computed = hmac.new(RAZORPAY_KEY_SECRET.encode("utf-8"), message, hashlib.sha256).hexdigest()
-        valid = hmac.compare_digest(computed, payload.razorpay_signature)
+        valid = _verify_signature(payload.razorpay_signature, message, _KEY_HMAC)
         if not valid:
             return VerifyPaymentResponse(valid=False, reason="signature_mismatch")
         return VerifyPaymentResponse(valid=True)
@@ -145,9 +160,8 @@ async def razorpay_webhook(request: Request):
     according to your application needs.
     """
     signature = request.headers.get("X-Razorpay-Signature", "")
-    body = await request.body()
 
-    if not RAZORPAY_WEBHOOK_SECRET:
+    if _WEBHOOK_HMAC is None:
         logger.warning("RAZORPAY_WEBHOOK_SECRET is not configured; rejecting webhook")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Webhook secret not configured")
 
@@ -156,12 +170,30 @@ async def razorpay_webhook(request: Request):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing signature header")
 
     try:
-        if not _verify_signature(signature, body, RAZORPAY_WEBHOOK_SECRET):
+        received = decode_hex_signature(signature)
+        if received is None:
+            # not hex at all: reject before reading any of the body
             logger.warning("Invalid webhook signature")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid signature")
 
-        # Process the webhook JSON payload as required by your app:
-        event = await request.json()
+        # Hash the body as it arrives instead of buffering it first
+        mac = _WEBHOOK_HMAC.copy()
+        chunks = []
+        async for chunk in request.stream():
+            mac.update(chunk)
+            chunks.append(chunk)
+        if not hmac.compare_digest(mac.digest(), received):
+            logger.warning("Invalid webhook signature")
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid signature")
+        body = b"".join(chunks)
+
+        # Process the webhook JSON payload as required by your app.
+        # Parse the bytes we already hold instead of re-reading via request.json().
+        try:
+            event = loads_exact(body)
+        except ValueError:
+            logger.warning("Invalid JSON in webhook payload")
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON")
         # Example minimal handling: log and return success. Replace with real logic.
         logger.info("Received valid webhook: %s", event.get("event"))
         return {"status": "ok"}
@@ -1,19 +1,133 @@
-from fastapi import APIRouter, Request, Header, HTTPException, BackgroundTasks, status
-from typing import Any, Dict, Optional
+from fastapi import APIRouter, FastAPI, Request, Header, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+import asyncio
 import hmac
-import hashlib
+from contextlib import asynccontextmanager
 import os
 import time
 import logging
 import json
+import orjson
+from ..json_body import loads_exact
+from ..signatures import decode_hex_signature, hmac_sha256
+
+"""
+app/routers/webhooks.py
+
+Stripe-compatible and generic HMAC webhook endpoints.
+
+Verified events are processed by a worker pool that this router's lifespan starts and
+stops. The lifespan only runs when the router is mounted with app.include_router(router);
+until it has started (or after it has shut down) the endpoints answer 503.
+"""
 
 logger = logging.getLogger("fastpay.webhooks")
-router = APIRouter(prefix="/webhooks", tags=["webhooks"])
 
 # Configuration via environment variables
 STRIPE_SIGNING_SECRET = os.getenv("STRIPE_SIGNING_SECRET")  # optional
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # generic HMAC secret (optional)
 TIMESTAMP_TOLERANCE_SECONDS = int(os.getenv("WEBHOOK_TIMESTAMP_TOLERANCE", "300"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", str(os.cpu_count() or 1)))
+WEBHOOK_DRAIN_TIMEOUT_SECONDS = 10
+
+# with no workers events would be accepted and never processed
+if WEBHOOK_WORKERS < 1:
+    raise RuntimeError(f"WEBHOOK_WORKERS must be at least 1, got {WEBHOOK_WORKERS}")
+
+# Stripe timestamp tolerance in nanoseconds, so the check stays in integer arithmetic
+_TOLERANCE_NS = TIMESTAMP_TOLERANCE_SECONDS * 1_000_000_000
+
+# Largest Content-Length trusted for pre-allocating a body buffer; bigger or
+# missing lengths fall back to Starlette's own body reading
+_MAX_PREALLOC_BODY = 1024 * 1024
+
+# Bodies at least this large are verified on a worker thread: hashlib releases the GIL
+# while hashing them, so concurrent webhooks hash in parallel and the event loop stays free.
+# Smaller bodies are verified inline, where thread dispatch would cost more than the hash.
+_OFFLOAD_VERIFY_BYTES = 16 * 1024
+
+# Stripe event types _process_stripe_event acts on, as JSON string literals
+_HANDLED_STRIPE_TYPES = (b'"payment_intent.succeeded"', b'"payment_intent.payment_failed"')
+
+# Verified events waiting for a worker, as (handler, payload); created by the router lifespan
+_EventHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+_event_queue: Optional[asyncio.Queue] = None
+
+
+async def _event_worker(queue: asyncio.Queue) -> None:
+    while True:
+        handler, payload = await queue.get()
+        try:
+            await handler(payload)
+        except Exception:
+            logger.exception("Error processing queued webhook event")
+        finally:
+            queue.task_done()
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    """
+    Run a fixed pool of workers draining a bounded event queue, so webhook
+    processing is decoupled from the request handlers that accept events.
+    """
+    global _event_queue
+    queue: asyncio.Queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+    workers = [asyncio.create_task(_event_worker(queue)) for _ in range(WEBHOOK_WORKERS)]
+    _event_queue = queue
+    try:
+        yield
+    finally:
+        _event_queue = None
+        try:
+            await asyncio.wait_for(queue.join(), timeout=WEBHOOK_DRAIN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Dropping %d queued webhook events on shutdown", queue.qsize())
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+# Must be mounted with app.include_router(router): that is what runs _lifespan
+router = APIRouter(prefix="/webhooks", tags=["webhooks"], default_response_class=ORJSONResponse, lifespan=_lifespan)
+
+
+def _enqueue_event(handler: _EventHandler, payload: Dict[str, Any]) -> None:
+    """
+    Hand a verified event to the worker pool; 503 when it is not running or is saturated.
+    """
+    if _event_queue is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Webhook workers not running")
+    try:
+        _event_queue.put_nowait((handler, payload))
+    except asyncio.QueueFull:
+        logger.warning("Webhook event queue is full")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Webhook queue full")
+
+
+async def _read_body_fast(request: Request) -> Union[bytes, bytearray]:
+    """
+    Read the request body into one buffer sized from Content-Length, instead of
+    collecting chunks and joining them. hmac, orjson and substring checks all accept
+    the returned bytearray directly, so it is not copied into bytes.
+    """
+    try:
+        size = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        size = 0
+    if size <= 0 or size > _MAX_PREALLOC_BODY:
+        return await request.body()
+    buf = bytearray(size)
+    offset = 0
+    async for chunk in request.stream():
+        end = offset + len(chunk)
+        buf[offset:end] = chunk  # grows the buffer if the client sent more than declared
+        offset = end
+    del buf[offset:]  # or trim it if less arrived
+    return buf
 
 
 def _parse_stripe_signature_header(header_value: str) -> Optional[Dict[str, str]]:
@@ -22,26 +136,28 @@ def _parse_stripe_signature_header(header_value: str) -> Optional[Dict[str, str]
     """
     if not header_value:
         return None
-    parts = header_value.split(",")
-    out = {}
-    for p in parts:
-        if "=" in p:
-            k, v = p.split("=", 1)
+    out: Dict[str, str] = {}
+    for p in header_value.split(","):
+        # partition scans each part once (vs. an "in" test followed by split)
+        k, sep, v = p.partition("=")
+        if sep:
             out[k.strip()] = v.strip()
     return out
 
 
-def _verify_hmac_signature(payload: bytes, signature: str, secret: str) -> bool:
+def _verify_hmac_signature(payload: Union[bytes, bytearray], signature: str, secret: str) -> bool:
     """
     Compute HMAC-SHA256(payload) with secret and compare to signature (hex).
     """
     if not secret or not signature:
         return False
-    mac = hmac.new(secret.encode("utf-8"), payload, hashlib.sha256).hexdigest()
-    return hmac.compare_digest(mac, signature)
+    received = decode_hex_signature(signature)
+    if received is None:
+        return False
+    return hmac.compare_digest(hmac_sha256(secret, payload), received)
 
 
-def _verify_stripe_signature(payload: bytes, header_value: str, secret: str) -> bool:
+def _verify_stripe_signature(payload: Union[bytes, bytearray], header_value: str, secret: str) -> bool:
     """
     Verify a Stripe-compatible signature header: uses "t=... , v1=..."
     Recreates Stripe's simple scheme: HMAC_SHA256("{timestamp}.{payload}")
@@ -58,13 +174,47 @@ def _verify_stripe_signature(payload: bytes, header_value: str, secret: str) ->
         timestamp = int(parsed["t"])
     except ValueError:
         return False
-    # timestamp tolerance
-    if abs(time.time() - timestamp) > TIMESTAMP_TOLERANCE_SECONDS:
+    received = decode_hex_signature(parsed["v1"])
+    if received is None:
+        return False
+    # timestamp tolerance, compared as integer nanoseconds (no float conversion)
+    skew_ns = time.time_ns() - timestamp * 1_000_000_000
+    if skew_ns > _TOLERANCE_NS or -skew_ns > _TOLERANCE_NS:
         logger.warning("Stripe signature timestamp outside tolerance")
         return False
-    signed_payload = str(timestamp).encode("utf-8") + b"." + payload
-    expected = hmac.new(secret.encode("utf-8"), signed_payload, hashlib.sha256).hexdigest()
-    return hmac.compare_digest(expected, parsed["v1"])
+    # signed payload is "{timestamp}.{payload}"; hash it in pieces rather than copying the body
+    return hmac.compare_digest(hmac_sha256(secret, b"%d." % timestamp, payload), received)
+
+
+async def _verify_body(verify: Callable[..., bool], payload: Union[bytes, bytearray], *args: str) -> bool:
+    """
+    Run a signature check over payload, off the event loop when the body is large.
+    """
+    if len(payload) >= _OFFLOAD_VERIFY_BYTES:
+        return await run_in_threadpool(verify, payload, *args)
+    return verify(payload, *args)
+
+
+def _loads_body(raw_body: Union[bytes, bytearray], source: str) -> Any:
+    """
+    Parse a webhook body that was already read for signature verification.
+    Endpoints never call request.json(), which would go back through Starlette's
+    body handling and parse with stdlib json.
+    """
+    try:
+        return loads_exact(raw_body)
+    except ValueError:
+        logger.warning("Invalid JSON in %s webhook", source)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON")
+
+
+def _may_be_handled_stripe_event(raw_body: Union[bytes, bytearray]) -> bool:
+    """
+    Cheap scan of the raw body for the handled event types. If none of them occurs anywhere,
+    the event cannot be one we act on and does not need to be deserialized. A hit only means
+    it may be handled; the parsed "type" field still decides.
+    """
+    return any(t in raw_body for t in _HANDLED_STRIPE_TYPES)
 
 
 async def _process_stripe_event(event: Dict[str, Any]) -> None:
@@ -109,7 +259,13 @@ async def _process_generic_event(payload: Dict[str, Any]) -> None:
     if etype:
         logger.debug("Generic event type: %s", etype)
     # Add integration with application services here
-    logger.debug("Generic payload: %s", json.dumps(payload)[:200])
+    if logger.isEnabledFor(logging.DEBUG):
+        try:
+            dumped = orjson.dumps(payload)
+        except orjson.JSONEncodeError:
+            # integers wider than 64 bits (kept exact by loads_exact) are beyond orjson
+            dumped = json.dumps(payload).encode("utf-8")
+        logger.debug("Generic payload: %s", dumped[:200].decode("utf-8", "replace"))
 
 
 @router.get("/health")
@@ -120,49 +276,41 @@ async def health():
 @router.post("/stripe")
 async def stripe_webhook(
     request: Request,
-    background_tasks: BackgroundTasks,
     stripe_signature: Optional[str] = Header(None, alias="Stripe-Signature"),
 ):
     """
     Endpoint to receive Stripe webhooks.
     Verifies Stripe-like signature if STRIPE_SIGNING_SECRET is configured.
-    Processing is delegated to background tasks.
+    Processing is delegated to the webhook worker pool.
     """
-    raw_body = await request.body()
+    raw_body = await _read_body_fast(request)
     if STRIPE_SIGNING_SECRET:
-        if not _verify_stripe_signature(raw_body, stripe_signature or "", STRIPE_SIGNING_SECRET):
+        if not await _verify_body(_verify_stripe_signature, raw_body, stripe_signature or "", STRIPE_SIGNING_SECRET):
             logger.warning("Stripe webhook signature verification failed")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid signature")
-    # parse JSON
-    try:
-        event = await request.json()
-    except Exception:
-        logger.exception("Invalid JSON in Stripe webhook")
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON")
-    # background processing
-    background_tasks.add_task(_process_stripe_event, event)
+    if not _may_be_handled_stripe_event(raw_body):
+        # acknowledge event types we don't handle without parsing them
+        logger.debug("Skipping unhandled stripe event")
+        return {"received": True}
+    event = _loads_body(raw_body, "Stripe")
+    _enqueue_event(_process_stripe_event, event)
     return {"received": True}
 
 
 @router.post("/generic")
 async def generic_webhook(
     request: Request,
-    background_tasks: BackgroundTasks,
     signature: Optional[str] = Header(None, alias="X-Signature"),
 ):
     """
     Generic webhook endpoint. If WEBHOOK_SECRET is set, validate an HMAC-SHA256 signature
     of the raw body against the X-Signature header (hex).
     """
-    raw_body = await request.body()
+    raw_body = await _read_body_fast(request)
     if WEBHOOK_SECRET:
-        if not _verify_hmac_signature(raw_body, signature or "", WEBHOOK_SECRET):
+        if not await _verify_body(_verify_hmac_signature, raw_body, signature or "", WEBHOOK_SECRET):
             logger.warning("Generic webhook signature verification failed")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid signature")
-    try:
-        payload = json.loads(raw_body.decode("utf-8"))
-    except Exception:
-        logger.exception("Invalid JSON in generic webhook")
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON")
-    background_tasks.add_task(_process_generic_event, payload)
+    payload = _loads_body(raw_body, "generic")
+    _enqueue_event(_process_generic_event, payload)
     return {"received": True}
\ No newline at end of file
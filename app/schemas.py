@@ -1,12 +1,12 @@
 from datetime import datetime
 from decimal import Decimal
 from enum import Enum
-from typing import List, Optional
-from uuid import UUID, uuid4
-from pydantic import BaseModel, EmailStr, Field, condecimal, validator
+from typing import Annotated, List, Optional
+from uuid import UUID
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 
 # Reusable decimal type for currency amounts (2 decimal places, > 0)
-Money = condecimal(gt=0, max_digits=18, decimal_places=2)
+Money = Annotated[Decimal, Field(gt=0, max_digits=18, decimal_places=2)]
 
 
 class PaymentStatus(str, Enum):
@@ -18,8 +18,7 @@ class PaymentStatus(str, Enum):
 
 
 class BaseSchema(BaseModel):
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # User-related schemas
@@ -88,10 +87,6 @@ class PaymentRead(PaymentBase):
     created_at: datetime
     completed_at: Optional[datetime] = None
 
-    @validator("reference", pre=True, always=True)
-    def ensure_reference(cls, v):
-        return v or f"pay_{uuid4().hex}"
-
 
 # Transaction history item
 class TransactionRead(BaseSchema):
@@ -1,16 +1,21 @@
-from typing import Optional, Dict, Any
-import os
+from decimal import Decimal, ROUND_HALF_EVEN
+from functools import lru_cache
+from typing import Optional, Dict, Any, Union
+import base64
 import logging
 import hmac
-import hashlib
+import httpx
+import orjson
 import requests
-from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
+from ..config import get_config
+from ..signatures import decode_hex_signature, keyed_hmac
 
 """
 /home/jatin/FastPay/app/services/razorpay_service.py
 
 Lightweight Razorpay service wrapper.
-Reads RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET from environment.
+Reads RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET from the cached config.
 
 Provides:
 - create_order(amount, currency='INR', receipt=None, notes=None)
@@ -20,9 +25,12 @@ Provides:
 - capture_payment(payment_id, amount)
 - refund_payment(payment_id, amount=None, notes=None)
 - verify_payment_signature(order_id, payment_id, signature)
+- acreate_order / afetch_order / afetch_payment / acapture_payment / arefund_payment:
+    non-blocking variants for async callers, always over `httpx.AsyncClient`
+    (close with `aclose()`)
 
 This wrapper will use the official `razorpay` package if available,
-otherwise falls back to direct HTTP calls via `requests`.
+otherwise falls back to direct HTTP calls over a pooled keep-alive `requests.Session`.
 """
 
 
@@ -34,6 +42,18 @@ except Exception:
 
 logger = logging.getLogger(__name__)
 
+# Amounts in major currency units; Decimal (e.g. the Money schema type) is converted exactly
+Amount = Union[Decimal, int, float]
+_HUNDRED = Decimal(100)
+
+
+@lru_cache(maxsize=256)
+def _to_paise_cached(amount: Decimal) -> int:
+        # exact: no float round-trip (1.015 -> 101.5 -> 102, where float gives 101.4999... -> 101).
+        # Cached because real traffic repeats a few price points; equal Decimals (99 vs 99.00)
+        # hash alike and convert alike, so they safely share an entry.
+        return int((amount * _HUNDRED).to_integral_value(rounding=ROUND_HALF_EVEN))
+
 
 class RazorpayServiceError(Exception):
         pass
@@ -41,10 +61,18 @@ class RazorpayServiceError(Exception):
 
 class RazorpayService:
         def __init__(self, key_id: Optional[str] = None, key_secret: Optional[str] = None):
-                self.key_id = key_id or os.getenv("RAZORPAY_KEY_ID")
-                self.key_secret = key_secret or os.getenv("RAZORPAY_KEY_SECRET")
+                cfg = get_config()
+                self.key_id = key_id or cfg.RAZORPAY_KEY_ID
+                self.key_secret = key_secret or cfg.RAZORPAY_KEY_SECRET
                 if not self.key_id or not self.key_secret:
                         raise RazorpayServiceError("RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET must be set in environment")
+                # pre-keyed once; verify_payment_signature works on copies
+                self._hmac_template = keyed_hmac(self.key_secret)
+
+                self._base = "https://api.razorpay.com/v1"
+                # Basic auth header encoded once instead of per request
+                credentials = base64.b64encode(f"{self.key_id}:{self.key_secret}".encode("utf-8")).decode("ascii")
+                headers = {"Authorization": f"Basic {credentials}", "Content-Type": "application/json"}
 
                 if razorpay:
                         self.client = razorpay.Client(auth=(self.key_id, self.key_secret))
@@ -52,24 +80,36 @@ class RazorpayService:
                 else:
                         self.client = None
                         self._use_client = False
-                        self._base = "https://api.razorpay.com/v1"
-                        self._auth = HTTPBasicAuth(self.key_id, self.key_secret)
+                        # one keep-alive connection pool for every call
+                        self._session = requests.Session()
+                        self._session.mount(self._base, HTTPAdapter(pool_maxsize=32))
+                        self._session.headers.update(headers)
+
+                # async callers (FastAPI routes) must not block the event loop on the
+                # blocking SDK / requests calls, so they always go through httpx; the client
+                # is opened on first async use so sync-only users never hold its pool
+                self._headers = headers
+                self._aclient: Optional[httpx.AsyncClient] = None
 
         @staticmethod
-        def _to_paise(amount: float) -> int:
-                # Accepts int/float in major currency (e.g., INR rupees). Returns integer paise.
+        def _to_paise(amount: Amount) -> int:
+                # Accepts Decimal/int/float in major currency (e.g., INR rupees). Returns integer paise.
+                if isinstance(amount, Decimal):
+                        return _to_paise_cached(amount)
+                # int/float are not cached (float keys would cache NaN and near-duplicate values)
                 return int(round(amount * 100))
 
-        def create_order(
-                self,
-                amount: float,
-                currency: str = "INR",
-                receipt: Optional[str] = None,
-                notes: Optional[Dict[str, str]] = None,
-                payment_capture: int = 1,
+        @classmethod
+        def _order_payload(
+                cls,
+                amount: Amount,
+                currency: str,
+                receipt: Optional[str],
+                notes: Optional[Dict[str, str]],
+                payment_capture: int,
         ) -> Dict[str, Any]:
                 payload = {
-                        "amount": self._to_paise(amount),
+                        "amount": cls._to_paise(amount),
                         "currency": currency,
                         "payment_capture": payment_capture,
                 }
@@ -77,68 +117,130 @@ class RazorpayService:
                         payload["receipt"] = receipt
                 if notes:
                         payload["notes"] = notes
+                return payload
+
+        @classmethod
+        def _refund_payload(cls, amount: Optional[Amount], notes: Optional[Dict[str, str]]) -> Dict[str, Any]:
+                payload: Dict[str, Any] = {}
+                if amount is not None:
+                        payload["amount"] = cls._to_paise(amount)
+                if notes:
+                        payload["notes"] = notes
+                return payload
+
+        def create_order(
+                self,
+                amount: Amount,
+                currency: str = "INR",
+                receipt: Optional[str] = None,
+                notes: Optional[Dict[str, str]] = None,
+                payment_capture: int = 1,
+        ) -> Dict[str, Any]:
+                payload = self._order_payload(amount, currency, receipt, notes, payment_capture)
 
                 if self._use_client:
                         return self.client.order.create(payload)
                 url = f"{self._base}/orders"
-                resp = requests.post(url, auth=self._auth, json=payload, timeout=10)
+                resp = self._session.post(url, data=orjson.dumps(payload), timeout=10)
                 if not resp.ok:
                         logger.error("create_order failed: %s %s", resp.status_code, resp.text)
                         raise RazorpayServiceError(f"create_order failed: {resp.status_code} {resp.text}")
-                return resp.json()
+                return orjson.loads(resp.content)
 
         def fetch_order(self, order_id: str) -> Dict[str, Any]:
                 if self._use_client:
                         return self.client.order.fetch(order_id)
                 url = f"{self._base}/orders/{order_id}"
-                resp = requests.get(url, auth=self._auth, timeout=10)
+                resp = self._session.get(url, timeout=10)
                 if not resp.ok:
                         raise RazorpayServiceError(f"fetch_order failed: {resp.status_code} {resp.text}")
-                return resp.json()
+                return orjson.loads(resp.content)
 
         def fetch_payment(self, payment_id: str) -> Dict[str, Any]:
                 if self._use_client:
                         return self.client.payment.fetch(payment_id)
                 url = f"{self._base}/payments/{payment_id}"
-                resp = requests.get(url, auth=self._auth, timeout=10)
+                resp = self._session.get(url, timeout=10)
                 if not resp.ok:
                         raise RazorpayServiceError(f"fetch_payment failed: {resp.status_code} {resp.text}")
-                return resp.json()
+                return orjson.loads(resp.content)
 
-        def capture_payment(self, payment_id: str, amount: float) -> Dict[str, Any]:
+        def capture_payment(self, payment_id: str, amount: Amount) -> Dict[str, Any]:
                 payload = {"amount": self._to_paise(amount)}
                 if self._use_client:
                         return self.client.payment.capture(payment_id, payload)
                 url = f"{self._base}/payments/{payment_id}/capture"
-                resp = requests.post(url, auth=self._auth, json=payload, timeout=10)
+                resp = self._session.post(url, data=orjson.dumps(payload), timeout=10)
                 if not resp.ok:
                         raise RazorpayServiceError(f"capture_payment failed: {resp.status_code} {resp.text}")
-                return resp.json()
+                return orjson.loads(resp.content)
 
-        def refund_payment(self, payment_id: str, amount: Optional[float] = None, notes: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
-                payload: Dict[str, Any] = {}
-                if amount is not None:
-                        payload["amount"] = self._to_paise(amount)
-                if notes:
-                        payload["notes"] = notes
+        def refund_payment(self, payment_id: str, amount: Optional[Amount] = None, notes: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+                payload = self._refund_payload(amount, notes)
 
                 if self._use_client:
                         return self.client.payment.refund(payment_id, payload)
                 url = f"{self._base}/payments/{payment_id}/refund"
-                resp = requests.post(url, auth=self._auth, json=payload or None, timeout=10)
+                resp = self._session.post(url, data=orjson.dumps(payload) if payload else None, timeout=10)
                 if not resp.ok:
                         raise RazorpayServiceError(f"refund_payment failed: {resp.status_code} {resp.text}")
-                return resp.json()
+                return orjson.loads(resp.content)
+
+        async def _arequest(self, op: str, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                if self._aclient is None:
+                        self._aclient = httpx.AsyncClient(base_url=self._base, headers=self._headers, timeout=10)
+                resp = await self._aclient.request(method, path, content=orjson.dumps(payload) if payload else None)
+                if resp.is_error:
+                        logger.error("%s failed: %s %s", op, resp.status_code, resp.text)
+                        raise RazorpayServiceError(f"{op} failed: {resp.status_code} {resp.text}")
+                return orjson.loads(resp.content)
+
+        async def acreate_order(
+                self,
+                amount: Amount,
+                currency: str = "INR",
+                receipt: Optional[str] = None,
+                notes: Optional[Dict[str, str]] = None,
+                payment_capture: int = 1,
+        ) -> Dict[str, Any]:
+                payload = self._order_payload(amount, currency, receipt, notes, payment_capture)
+                return await self._arequest("create_order", "POST", "/orders", payload)
+
+        async def afetch_order(self, order_id: str) -> Dict[str, Any]:
+                return await self._arequest("fetch_order", "GET", f"/orders/{order_id}")
+
+        async def afetch_payment(self, payment_id: str) -> Dict[str, Any]:
+                return await self._arequest("fetch_payment", "GET", f"/payments/{payment_id}")
+
+        async def acapture_payment(self, payment_id: str, amount: Amount) -> Dict[str, Any]:
+                payload = {"amount": self._to_paise(amount)}
+                return await self._arequest("capture_payment", "POST", f"/payments/{payment_id}/capture", payload)
+
+        async def arefund_payment(
+                self, payment_id: str, amount: Optional[Amount] = None, notes: Optional[Dict[str, str]] = None
+        ) -> Dict[str, Any]:
+                payload = self._refund_payload(amount, notes)
+                return await self._arequest("refund_payment", "POST", f"/payments/{payment_id}/refund", payload)
+
+        async def aclose(self) -> None:
+                # no-op unless an async call opened the client
+                if self._aclient is not None:
+                        await self._aclient.aclose()
+                        self._aclient = None
 
         def verify_payment_signature(self, order_id: str, payment_id: str, signature: str) -> bool:
                 """
                 Verifies razorpay signature. signature should be the value from frontend (razorpay_payment_signature).
                 Computation: hmac_sha256(order_id + '|' + payment_id, key_secret).hexdigest() (lowercase)
                 """
-                msg = f"{order_id}|{payment_id}".encode("utf-8")
-                secret = self.key_secret.encode("utf-8")
-                generated = hmac.new(secret, msg, hashlib.sha256).hexdigest()
-                valid = hmac.compare_digest(generated, signature)
+                received = decode_hex_signature(signature)
+                if received is None:
+                        valid = False
+                else:
+                        mac = self._hmac_template.copy()
+                        mac.update(f"{order_id}|{payment_id}".encode("utf-8"))
+                        # compare raw digests rather than hex-encoding the computed one
+                        valid = hmac.compare_digest(mac.digest(), received)
                 if not valid:
                         logger.warning("verify_payment_signature failed for order=%s payment=%s", order_id, payment_id)
                 return valid
\ No newline at end of file
@@ -0,0 +1,50 @@
+from functools import lru_cache
+from typing import Optional, Union
+import hashlib
+import hmac
+import re
+
+"""
+app/signatures.py
+
+Helpers shared by every HMAC-SHA256 signature check (webhook routers and RazorpayService).
+"""
+
+
+# lowercase hex SHA-256 digest, as produced by hexdigest(); fromhex alone would also take
+# uppercase and skip embedded whitespace, decoding to fewer than 32 bytes
+_HEX64 = re.compile(r"[0-9a-f]{64}")
+
+
+def decode_hex_signature(signature: str) -> Optional[bytes]:
+    """
+    Decode a hex signature to raw digest bytes (None unless it is exactly 64 lowercase hex
+    characters), so digests are compared as bytes instead of hex-encoding every computed
+    digest. Malformed signatures are rejected here, before any HMAC work over the payload.
+    """
+    if not _HEX64.fullmatch(signature):
+        return None
+    return bytes.fromhex(signature)
+
+
+@lru_cache(maxsize=None)
+def keyed_hmac(secret: str) -> "hmac.HMAC":
+    """
+    Pre-keyed HMAC-SHA256 object for secret, built once per secret.
+    Callers must copy() it rather than update it directly.
+    """
+    return hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+
+
+def hmac_sha256(secret: str, *parts: Union[bytes, bytearray]) -> bytes:
+    """
+    Raw HMAC-SHA256 digest keyed with secret over the concatenation of parts,
+    fed incrementally so callers never have to build that concatenation.
+    hashlib's sha256 is OpenSSL's, which already selects SHA-NI / ARMv8 SHA2
+    instructions at runtime when the CPU advertises them. Copying the pre-keyed
+    object skips re-deriving the ipad/opad state from the secret on every call.
+    """
+    mac = keyed_hmac(secret).copy()
+    for part in parts:
+        mac.update(part)
+    return mac.digest()